@@ -1,115 +1,245 @@
 import os
 import json
 import sys
+import orjson
+import asyncio
+import hashlib
+import tempfile
 import numpy as np
-import faiss
-from groq import Groq
+import httpx
+import simsimd
+from groq import AsyncGroq
+import torch
 from sentence_transformers import SentenceTransformer
 
+# Intel Extension for PyTorch is optional: when installed, MiniLM runs in BF16
+try:
+    import intel_extension_for_pytorch as ipex
+except ImportError:
+    ipex = None
+
+# Graph-optimized (level O3) ONNX export of MiniLM shipped in the model repo
+ONNX_MODEL_FILE = 'onnx/model_O3.onnx'
+
+# LLM responses are cached on the shared documents volume so pipeline reruns
+# over the same content don't pay for the same Groq calls again
+DEFAULT_CACHE_DIR = '/app/documents/cache'
+
 class AIAnalystRAG:
-    def __init__(self, db_path, model='llama-3.3-70b-versatile'):
+    def __init__(self, db_path, model='llama-3.3-70b-versatile', max_concurrent_requests=20,
+                 cache_dir=None):
         self.db_path = db_path
         self.llm_model = model
+        self.max_concurrent_requests = max_concurrent_requests
+        self.cache_dir = cache_dir or os.getenv("LLM_CACHE_DIR", DEFAULT_CACHE_DIR)
+        os.makedirs(self.cache_dir, exist_ok=True)
         
         # 1. Load Groq client
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             raise ValueError("GROQ_API_KEY environment variable not set!")
-        self.groq_client = Groq(api_key=api_key)
+        # One keep-alive HTTP/2 client is shared by every request in the run, so
+        # concurrent LLM calls are multiplexed instead of each doing a TLS handshake
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=max_concurrent_requests,
+                max_keepalive_connections=max_concurrent_requests
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        self.groq_client = AsyncGroq(api_key=api_key, http_client=http_client)
         
         # 2. Load the *same* embedding model used for indexing
         print("🤖 Loading embedding model...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("✅ Embedding model loaded.")
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.use_bf16 = ipex is not None and self.device == 'cpu'
+        # On a plain CPU, ONNX Runtime with the pre-optimized graph beats PyTorch eager mode
+        self.backend = 'onnx' if self.device == 'cpu' and not self.use_bf16 else 'torch'
+        self.embedding_model = SentenceTransformer(
+            'all-MiniLM-L6-v2',
+            device=self.device,
+            backend=self.backend,
+            model_kwargs={'file_name': ONNX_MODEL_FILE} if self.backend == 'onnx' else None
+        )
+        if self.use_bf16:
+            self.embedding_model[0].auto_model = ipex.optimize(self.embedding_model[0].auto_model.eval(), dtype=torch.bfloat16)
+            print("⚡ Intel Extension for PyTorch found, encoding in BF16.")
+        print(f"✅ Embedding model loaded on {self.device} ({self.backend}).")
         
-        # 3. Load our vector database from the JSON file
+        # 3. Load our vector database's chunk text from the JSON file
         print(f"📂 Loading vector database from {db_path}...")
-        with open(db_path, 'r', encoding='utf-8') as f:
-            self.database = json.load(f)
-        
-        # 4. Build the FAISS index in memory
-        self.build_faiss_index()
-
-    def build_faiss_index(self):
-        """Builds an in-memory FAISS index from the loaded vectors."""
-        print("🧠 Building FAISS index...")
-        vectors = [item['vector'] for item in self.database]
-        self.vectors = np.array(vectors).astype('float32')
+        with open(db_path, 'rb') as f:
+            self.database = orjson.loads(f.read())
         
-        # Get the dimension of the vectors
-        d = self.vectors.shape[1]
+        # 4. Load the prebuilt FAISS index (only large databases have one)
+        self.load_faiss_index()
         
-        # Using IndexFlatL2 for simple, accurate L2 distance search
-        self.index = faiss.IndexFlatL2(d)
-        self.index.add(self.vectors)
-        print(f"✅ FAISS index built with {self.index.ntotal} vectors.")
-
-    def retrieve(self, query_text, k=5):
-        """Retrieves the top-k most relevant text chunks for a query."""
-        print(f"🔍 Searching for context: '{query_text}'")
-        # 1. Embed the query
-        query_vector = self.embedding_model.encode([query_text])
+        # 5. Without an index, load the raw vectors from the .npy file for the exact scan
+        self.vectors = None
+        if self.index is None:
+            vectors_path = os.path.splitext(db_path)[0] + '.npy'
+            self.vectors = np.load(vectors_path).astype('float32')
+            print(f"🧠 {len(self.vectors)} vectors: using exact SimSIMD search, no FAISS index needed.")
+
+    def load_faiss_index(self):
+        """Loads the FAISS index that process_pdf.py saved next to the database, if any."""
+        index_path = os.path.splitext(self.db_path)[0] + '.faiss'
+        if not os.path.exists(index_path):
+            # Only large databases get an index; small ones are scanned exactly
+            self.index = None
+            return
+
+        # Imported lazily so small databases never pay for loading FAISS
+        import faiss
+        print(f"🧠 Loading FAISS index from {index_path}...")
+        self.index = faiss.read_index(index_path)
+        print(f"✅ FAISS index loaded with {self.index.ntotal} vectors.")
+
+    def search(self, query_vectors, k):
+        """Returns the indices of the k nearest chunks for each query vector, closest first."""
+        if self.index is not None:
+            # D = distances, I = indices (of the chunks in our list), one row per query
+            D, I = self.index.search(query_vectors, k)
+            return I
+
+        # Exact scan: one cosine-distance row per query against every stored vector
+        distances = np.asarray(simsimd.cdist(query_vectors, self.vectors, metric='cosine'))
+        k = min(k, distances.shape[1])
+        top_k = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        # argpartition leaves the top-k unordered, so sort them by distance
+        order = np.take_along_axis(distances, top_k, axis=1).argsort(axis=1)
+        return np.take_along_axis(top_k, order, axis=1)
+
+    def retrieve(self, query_texts, k=5):
+        """Retrieves the top-k most relevant text chunks for each query."""
+        for query_text in query_texts:
+            print(f"🔍 Searching for context: '{query_text}'")
+        # 1. Embed all queries in a single batched forward pass
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.use_bf16):
+            query_vectors = self.embedding_model.encode(
+                query_texts, batch_size=8, convert_to_numpy=True, normalize_embeddings=True
+            )
         
-        # 2. Search the FAISS index
-        # D = distances, I = indices (of the chunks in our list)
-        D, I = self.index.search(query_vector.astype('float32'), k)
+        # 2. Search for every query at once
+        I = self.search(query_vectors.astype('float32'), k)
         
-        # 3. Retrieve the actual text content
-        retrieved_chunks = [self.database[i]['content'] for i in I[0]]
-        return "\n---\n".join(retrieved_chunks)
+        # 3. Retrieve the actual text content (FAISS pads with -1 when k > ntotal)
+        contexts = []
+        for row in I:
+            retrieved_chunks = [self.database[i]['content'] for i in row if i >= 0]
+            contexts.append("\n---\n".join(retrieved_chunks))
+        return contexts
 
-    def generate(self, prompt, context):
+    def write_cache(self, cache_path, content):
+        """Atomically stores an LLM response, so readers never see a partial file."""
+        # Analyst containers for different PDFs share the cache directory: write to a
+        # temp file next to the target, then rename it into place in one step
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    async def generate(self, prompt, context, semaphore):
         """Sends the prompt and retrieved context to the LLM."""
         full_prompt = f"Context:\n{context}\n\nTask:\n{prompt}"
+        temperature = 0.1
+        
+        # Identical model + temperature + prompt means we can reuse an earlier answer
+        cache_key = hashlib.sha256(json.dumps([self.llm_model, temperature, full_prompt]).encode('utf-8')).hexdigest()
+        cache_path = os.path.join(self.cache_dir, f"{cache_key}.txt")
+        if os.path.exists(cache_path):
+            print(f"♻️ Using cached LLM response {cache_key[:12]}")
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
         
         try:
-            response = self.groq_client.chat.completions.create(
-                messages=[{"role": "user", "content": full_prompt}],
-                model=self.llm_model,
-                temperature=0.1
-            )
-            return response.choices[0].message.content
+            # The semaphore caps in-flight requests to stay under Groq's rate limits
+            async with semaphore:
+                response = await self.groq_client.chat.completions.create(
+                    messages=[{"role": "user", "content": full_prompt}],
+                    model=self.llm_model,
+                    temperature=temperature
+                )
+            content = response.choices[0].message.content
+            # Only successful responses are cached, so failures are retried next run
+            self.write_cache(cache_path, content)
+            return content
         except Exception as e:
             print(f"❌ LLM generation failed: {e}")
             return f"Error: {e}"
 
-    def run_analysis(self, output_path):
+    def parse_chart_spec(self, raw_chart):
+        """Extracts the JSON chart spec from the LLM reply, or None if it isn't valid JSON.
+
+        The spec is passed through as-is: the report service's ChartSpec decides
+        whether it can actually be drawn.
+        """
+        # Clean up a code block around the JSON, if the model added one
+        if "```" in raw_chart:
+            raw_chart = raw_chart.split("```")[1]
+            if raw_chart.startswith("json"):
+                raw_chart = raw_chart[len("json"):]
+        
+        try:
+            spec = json.loads(raw_chart.strip())
+        except json.JSONDecodeError:
+            print("⚠️ LLM did not return a valid chart spec.")
+            return None
+        return spec
+
+    async def run_analysis(self, output_path):
         """Runs the full RAG-based analysis to build the report."""
         print("🚀 Starting RAG analysis...")
         final_report = {}
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
         
-        # Task 1: Identify Key Themes
-        context_themes = self.retrieve("What are the main themes, topics, goals, and corporate strategies discussed?")
-        final_report['key_insights'] = self.generate(
-            "Identify 3-5 key themes from the context. For each theme, provide a concise one-sentence summary.",
-            context_themes
-        )
-        
-        # Task 2: Suggest Revenue Strategies
-        context_revenue = self.retrieve("What are the financial results, sales performance, revenue challenges, and growth opportunities?")
-        final_report['revenue_suggestions'] = self.generate(
-            "Based on the context, suggest 2-3 actionable revenue growth strategies.",
-            context_revenue
-        )
+        # Retrieve context for all three tasks with one embedding + search pass
+        context_themes, context_revenue, context_graph = self.retrieve([
+            # Task 1: Identify Key Themes
+            "What are the main themes, topics, goals, and corporate strategies discussed?",
+            # Task 2: Suggest Revenue Strategies
+            "What are the financial results, sales performance, revenue challenges, and growth opportunities?",
+            # Task 3: Generate Graph Code
+            "Find all quantifiable data, financials, numbers, or statistics over time (e.g., by year, quarter).",
+        ])
         
-        # Task 3: Generate Graph Code
-        context_graph = self.retrieve("Find all quantifiable data, financials, numbers, or statistics over time (e.g., by year, quarter).")
-        raw_code = self.generate(
-            "Generate Python Matplotlib code for a simple bar or line chart based *only* on the data in the context. "
-            "Enclose the code in triple backticks (```python...```). If no data is found, say 'No data available'.",
-            context_graph
+        # The three LLM calls are independent, so send them all at once
+        final_report['key_insights'], final_report['revenue_suggestions'], raw_chart = await asyncio.gather(
+            self.generate(
+                "Identify 3-5 key themes from the context. For each theme, provide a concise one-sentence summary.",
+                context_themes,
+                semaphore
+            ),
+            self.generate(
+                "Based on the context, suggest 2-3 actionable revenue growth strategies.",
+                context_revenue,
+                semaphore
+            ),
+            self.generate(
+                "Describe a simple bar or line chart based *only* on the data in the context. "
+                "Reply with a single JSON object and nothing else, in this form: "
+                '{"type": "bar" or "line", "title": "...", "x_label": "...", "y_label": "...", '
+                '"x": [category labels or years], "y": [numbers, same length as x]}. '
+                'If no data is found, reply with {"type": "none"}.',
+                context_graph,
+                semaphore
+            ),
         )
         
-        # Clean up the code block
-        if "```python" in raw_code:
-            raw_code = raw_code.split("```python")[1].split("```")[0].strip()
-        
         final_report['visualization'] = {
             "title": "Data Visualization",
-            "plot_code": raw_code,
+            "chart": self.parse_chart_spec(raw_chart),
             "insight": "Plot generated from retrieved data."
         }
         
+        # All LLM calls are done; release the shared connection pool
+        await self.groq_client.close()
+        
         # Save the final JSON report
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(final_report, f, indent=2)
@@ -124,4 +254,4 @@ if __name__ == "__main__":
     report_path = sys.argv[2]
     
     analyst = AIAnalystRAG(db_path)
-    analyst.run_analysis(report_path)
\ No newline at end of file
+    asyncio.run(analyst.run_analysis(report_path))
\ No newline at end of file
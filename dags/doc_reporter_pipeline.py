@@ -1,4 +1,5 @@
 from airflow.models.dag import DAG
+from airflow.decorators import task, task_group
 from airflow.providers.docker.operators.docker import DockerOperator
 from datetime import datetime
 import os
@@ -8,6 +9,11 @@ from docker.types import Mount  # <-- ADD THIS IMPORT
 HOST_DOCUMENTS_DIR = 'C:/Users/saivi/OneDrive/Desktop/DocReporter/documents'
 HOST_ENV_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
+# The same documents folder as seen from inside the Airflow and task containers
+DOCUMENTS_DIR = '/app/documents'
+INPUT_DIR = f'{DOCUMENTS_DIR}/input'
+OUTPUT_DIR = f'{DOCUMENTS_DIR}/output'
+
 with DAG(
     dag_id='doc_reporter_pipeline',
     start_date=datetime(2025, 1, 1),
@@ -16,48 +22,72 @@ with DAG(
     tags=['doc-reporter'],
 ) as dag:
 
-    # Task 1: Run the 'process-app' container
-    task_process = DockerOperator(
-        task_id='run_processing_service',
-        image='process-app:latest',
-        container_name='task_process_pdf',
-        command='python process_pdf.py /app/documents/input/sample.pdf /app/documents/output/vector_database.json',
-        # --- FIX IS HERE ---
-        mounts=[Mount(target='/app/documents', source=HOST_DOCUMENTS_DIR, type='bind')],
-        # -----------------
-        auto_remove=True,
-        docker_url='unix://var/run/docker.sock',
-        network_mode='bridge'
-    )
-
-    # Task 2: Run the 'analyst-app' container
-    task_analyze = DockerOperator(
-        task_id='run_analysis_service',
-        image='analyst-app:latest',
-        container_name='task_analyze_report',
-        command='python analyst.py /app/documents/output/vector_database.json /app/documents/output/analyst_report.json',
-        # --- FIX IS HERE ---
-        mounts=[Mount(target='/app/documents', source=HOST_DOCUMENTS_DIR, type='bind')],
-        # -----------------
-        env_file=HOST_ENV_FILE,
-        auto_remove=True,
-        docker_url='unix://var/run/docker.sock',
-        network_mode='bridge'
-    )
-
-    # Task 3: Run the 'report-app' container
-    task_report = DockerOperator(
-        task_id='run_reporting_service',
-        image='report-app:latest',
-        container_name='task_generate_report',
-        command='python generate_report.py /app/documents/output/analyst_report.json /app/documents/output/final_report.pdf',
-        # --- FIX IS HERE ---
-        mounts=[Mount(target='/app/documents', source=HOST_DOCUMENTS_DIR, type='bind')],
-        # -----------------
-        auto_remove=True,
-        docker_url='unix://var/run/docker.sock',
-        network_mode='bridge'
-    )
-
-    # Define the dependency chain
-    task_process >> task_analyze >> task_report
\ No newline at end of file
+    # Task 0: Find every PDF waiting in the input folder (evaluated at run time)
+    @task
+    def list_input_pdfs():
+        return sorted(name for name in os.listdir(INPUT_DIR) if name.lower().endswith('.pdf'))
+
+    @task(multiple_outputs=True)
+    def build_commands(pdf_file):
+        # Inputs use the real file name (any extension case); outputs are prefixed
+        # with the full file name too, so 'a.pdf' and 'a.PDF' never share outputs.
+        # Commands are lists so file names with spaces reach the scripts intact.
+        db_path = f'{OUTPUT_DIR}/{pdf_file}_vector_database.json'
+        report_json_path = f'{OUTPUT_DIR}/{pdf_file}_analyst_report.json'
+        return {
+            'process': ['python', 'process_pdf.py', f'{INPUT_DIR}/{pdf_file}', db_path],
+            'analyze': ['python', 'analyst.py', db_path, report_json_path],
+            'report': ['python', 'generate_report.py', report_json_path, f'{OUTPUT_DIR}/{pdf_file}_final_report.pdf'],
+        }
+
+    # The whole chain is mapped per PDF, so each document runs in its own containers
+    # and only waits on its own upstream step: one failing PDF doesn't block the rest.
+    # (No fixed container_name: parallel containers would clash on it.)
+    @task_group
+    def process_document(pdf_file):
+        commands = build_commands(pdf_file)
+
+        # Task 1: Run the 'process-app' container
+        task_process = DockerOperator(
+            task_id='run_processing_service',
+            image='process-app:latest',
+            command=commands['process'],
+            # --- FIX IS HERE ---
+            mounts=[Mount(target=DOCUMENTS_DIR, source=HOST_DOCUMENTS_DIR, type='bind')],
+            # -----------------
+            auto_remove=True,
+            docker_url='unix://var/run/docker.sock',
+            network_mode='bridge'
+        )
+
+        # Task 2: Run the 'analyst-app' container
+        task_analyze = DockerOperator(
+            task_id='run_analysis_service',
+            image='analyst-app:latest',
+            command=commands['analyze'],
+            # --- FIX IS HERE ---
+            mounts=[Mount(target=DOCUMENTS_DIR, source=HOST_DOCUMENTS_DIR, type='bind')],
+            # -----------------
+            env_file=HOST_ENV_FILE,
+            auto_remove=True,
+            docker_url='unix://var/run/docker.sock',
+            network_mode='bridge'
+        )
+
+        # Task 3: Run the 'report-app' container
+        task_report = DockerOperator(
+            task_id='run_reporting_service',
+            image='report-app:latest',
+            command=commands['report'],
+            # --- FIX IS HERE ---
+            mounts=[Mount(target=DOCUMENTS_DIR, source=HOST_DOCUMENTS_DIR, type='bind')],
+            # -----------------
+            auto_remove=True,
+            docker_url='unix://var/run/docker.sock',
+            network_mode='bridge'
+        )
+
+        # Define the dependency chain
+        task_process >> task_analyze >> task_report
+
+    process_document.expand(pdf_file=list_input_pdfs())
\ No newline at end of file
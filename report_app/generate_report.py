@@ -1,6 +1,7 @@
 import json
 import sys
 import os
+from dataclasses import dataclass
 from fpdf import FPDF
 
 # --- Matplotlib Setup ---
@@ -11,9 +12,47 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 # ------------------------
 
+@dataclass
+class ChartSpec:
+    """A chart described by the analyst as data, instead of as code to run."""
+    chart_type: str
+    x: list
+    y: list
+    title: str = ""
+    x_label: str = ""
+    y_label: str = ""
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Validates the analyst's chart JSON; returns None if it can't be drawn."""
+        if not isinstance(spec, dict) or spec.get("type") not in CHART_RENDERERS:
+            return None
+        x, y = spec.get("x"), spec.get("y")
+        if not isinstance(x, list) or not isinstance(y, list) or not x or len(x) != len(y):
+            return None
+        try:
+            y = [float(value) for value in y]
+        except (TypeError, ValueError):
+            return None
+        return cls(
+            chart_type=spec["type"],
+            x=[str(label) for label in x],
+            y=y,
+            title=str(spec.get("title", "")),
+            x_label=str(spec.get("x_label", "")),
+            y_label=str(spec.get("y_label", "")),
+        )
+
+# Each supported chart type maps to a fixed Matplotlib routine
+CHART_RENDERERS = {
+    "bar": lambda ax, spec: ax.bar(spec.x, spec.y),
+    "line": lambda ax, spec: ax.plot(spec.x, spec.y, marker="o"),
+}
+
 class PDFReportGenerator:
     def __init__(self, json_path, output_pdf_path):
         self.output_pdf_path = output_pdf_path
+        self.figure = plt.figure()
         print(f"📂 Loading analyst report from {json_path}...")
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
@@ -22,18 +61,24 @@ class PDFReportGenerator:
             print(f"❌ Failed to load analyst report: {e}")
             sys.exit(1)
 
-    def execute_plot_code(self, code, image_path):
-        """Safely execute string code to generate and save a plot."""
-        if not code or code == "No data available":
-            print("⚠️ No plot code found to execute.")
+    def render_chart(self, chart, image_path):
+        """Draw the analyst's chart spec with a fixed plotting routine and save it."""
+        spec = ChartSpec.from_dict(chart)
+        if spec is None:
+            print("⚠️ No usable chart spec found to render.")
             return False
         
         print(f"🎨 Generating plot at {image_path}...")
         try:
-            # We execute the code, which uses 'plt' to create a plot
-            exec(code) 
-            plt.savefig(image_path)
-            plt.close() # Close the plot to free up memory
+            # One figure is reused for every chart; clear it before drawing
+            self.figure.clear()
+            ax = self.figure.add_subplot()
+            CHART_RENDERERS[spec.chart_type](ax, spec)
+            ax.set_title(spec.title)
+            ax.set_xlabel(spec.x_label)
+            ax.set_ylabel(spec.y_label)
+            self.figure.tight_layout()
+            self.figure.savefig(image_path)
             return True
         except Exception as e:
             print(f"❌ Plot generation failed: {e}")
@@ -71,9 +116,10 @@ class PDFReportGenerator:
         pdf.cell(0, 10, "Visualizations", ln=True)
         
         viz_data = self.data.get("visualization", {})
-        plot_path = "/app/documents/output/temp_plot.png" # Use a path inside the container
+        # Named after the output PDF so reports generated in parallel don't clash
+        plot_path = os.path.splitext(self.output_pdf_path)[0] + "_plot.png"
         
-        if self.execute_plot_code(viz_data.get("plot_code"), plot_path):
+        if self.render_chart(viz_data.get("chart"), plot_path):
             pdf.image(plot_path, w=160) # Embed the image
             os.remove(plot_path) # Clean up the temp image file
             pdf.set_font("Arial", 'I', 10)